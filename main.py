@@ -1,59 +1,341 @@
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import sys
+
 import numpy as np
 import networkx as nx
+import matplotlib
+
+if not sys.flags.interactive:
+    #batch runs render straight to files, no GUI event loop
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import igraph
+    IGRAPH_AVAILABLE = True
+except ImportError:
+    IGRAPH_AVAILABLE = False
+
+try:
+    import cupy as cp
+    CUPY_AVAILABLE = True
+except ImportError:
+    CUPY_AVAILABLE = False
+
+#graph backend for metric computation: 'igraph' and 'numba' run per matrix,
+#anything else takes the batched numpy path; unavailable engines fall back
+ENGINE = os.environ.get('GRAPH_ENGINE', 'igraph')
+
+
+if NUMBA_AVAILABLE:
+    @njit('float64[:](uint8[:,:])', parallel=True, cache=True, fastmath=True, boundscheck=False)
+    def clustering_numba(A):
+        '''
+        Clustering coefficient per node, straight from the adjacency matrix
+        :param A: C-contiguous uint8 adjacency matrix
+        :return: array of clustering coefficients
+        '''
+        n = A.shape[0]
+        coeffs = np.zeros(n, dtype=np.float64)
+        for i in prange(n):
+            neighbors = np.empty(n, dtype=np.int32)
+            k = 0
+            for j in range(n):
+                if j != i and A[i, j] != 0:
+                    neighbors[k] = j
+                    k += 1
+            if k < 2:
+                continue
+            #symmetric matrix: each neighbor pair only needs testing once
+            t = 0
+            for a in range(k):
+                for b in range(a + 1, k):
+                    if A[neighbors[a], neighbors[b]] != 0:
+                        t += 1
+            coeffs[i] = 2 * t / (k * (k - 1))
+        return coeffs
+
+    @njit('float64[:](uint64[:,:], int64[:])', parallel=True, cache=True, fastmath=True, boundscheck=False)
+    def clustering_bitset(A_bits, deg):
+        '''
+        Clustering coefficient from uint64 bitset rows; the triangle test per
+        edge is one AND plus a SWAR popcount over 64 nodes at a time
+        :param A_bits: packed adjacency rows, bit j of row i set iff edge (i, j)
+        :param deg: neighbor count per node (self-loops excluded)
+        :return: array of clustering coefficients
+        '''
+        n = A_bits.shape[0]
+        words = A_bits.shape[1]
+        coeffs = np.zeros(n, dtype=np.float64)
+        for i in prange(n):
+            d = deg[i]
+            if d < 2:
+                continue
+            t = np.uint64(0)
+            for j in range(n):
+                if (A_bits[i, j >> 6] >> np.uint64(j & 63)) & np.uint64(1):
+                    #common neighbors of i and j == triangles through edge (i, j)
+                    for w in range(words):
+                        x = A_bits[i, w] & A_bits[j, w]
+                        x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+                        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+                        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+                        t += (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+            #each triangle is seen from both endpoints of the opposite edge
+            coeffs[i] = t / (d * (d - 1))
+        return coeffs
+
 
-def read_matrices(file_path)->dict:
+def pack_bitset(matrix)->np.ndarray:
+    '''
+    Pack adjacency rows into uint64 bitset words (bit j of row i = edge i-j),
+    with the diagonal cleared so self-loops stay out of triangle counts
+    :param matrix: adjacency matrix
+    :return: (n, ceil(n/64)) uint64 array
+    '''
+    n = matrix.shape[0]
+    words = (n + 63) // 64
+    padded = np.zeros((n, words * 64), dtype=np.uint8)
+    padded[:, :n] = matrix != 0
+    np.fill_diagonal(padded, 0)
+    return np.packbits(padded, axis=1, bitorder='little').view(np.uint64)
+
+
+def _label_for(name)->str:
+    '''
+    Classify a subject as healthy or sick from its matrix name
+    :param name: matrix name
+    :return: 'healthy' or 'sick'
+    '''
+    return 'healthy' if 'healthy' in name else 'sick'
+
+
+def read_matrices(file_path)->tuple:
     '''
     Read adjacency matrices from a file
     :param file_path:  path to the file
-    :return: dictionary of matrices
+    :return: dictionary of matrices and dictionary of healthy/sick labels
     '''
     with open(file_path, 'r') as file:
         matrices = {}
         matrix_name = None
-        matrix_data = []
+        block_lines = []
 
         for line in file:
             line = line.strip()
             if line.startswith('# Matrix'):
-                if matrix_name is not None and matrix_data:
-                    matrices[matrix_name] = np.array(matrix_data)
+                if matrix_name is not None and block_lines:
+                    #loadtxt's C tokenizer consumes the block lines directly,
+                    #no joined-string copy and no Python-level int parsing
+                    matrices[matrix_name] = np.loadtxt(block_lines, dtype=np.uint8, ndmin=2)
                 matrix_name = line.split()[2]
-                matrix_data = []
+                block_lines = []
             elif line:
-                matrix_data.append(list(map(int, line.split())))
+                block_lines.append(line)
+
+        if matrix_name is not None and block_lines:
+            matrices[matrix_name] = np.loadtxt(block_lines, dtype=np.uint8, ndmin=2)
 
-        if matrix_name is not None and matrix_data:
-            matrices[matrix_name] = np.array(matrix_data)
+    labels = {name: _label_for(name) for name in matrices}
+    return matrices, labels
 
-    return matrices
+
+def read_matrices_binary(file_path)->tuple:
+    '''
+    Read adjacency matrices through a compressed binary cache,
+    falling back to text parsing (and writing the cache) on the first run
+    :param file_path: path to the text file
+    :return: dictionary of matrices and dictionary of healthy/sick labels
+    '''
+    cache_path = file_path + '.npz'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        with np.load(cache_path) as cache:
+            matrices = {name: cache[name] for name in cache.files}
+        return matrices, {name: _label_for(name) for name in matrices}
+
+    matrices, labels = read_matrices(file_path)
+    np.savez_compressed(cache_path, **matrices)
+    return matrices, labels
 
 
 def calculate_metrics(matrix)->tuple:
     '''
     Calculate the degree and clustering coefficient of a network
     :param matrix: adjacency matrix
-    :return: degree and clustering coefficient
+    :return: degree and clustering coefficient, as per-node arrays
     '''
-    G = nx.from_numpy_array(matrix)
-    degree = dict(G.degree())
-    clustering_coeff = nx.clustering(G)
+    if ENGINE == 'igraph' and IGRAPH_AVAILABLE:
+        g = igraph.Graph.Adjacency((matrix > 0).tolist(), mode='undirected')
+        deg = np.asarray(g.degree(), dtype=np.int64)
+        cc = np.asarray(g.transitivity_local_undirected(mode='zero'))
+        return deg, cc
+
+    loops = (np.diag(matrix) != 0)
+    #self-loops count twice towards degree but form no triangles
+    deg = np.count_nonzero(matrix, axis=1) + loops
 
-    return degree, clustering_coeff
+    if NUMBA_AVAILABLE:
+        A = np.ascontiguousarray(matrix.astype(np.uint8))
+        if A.shape[0] >= 512:
+            #bitset kernel: 64 edge tests per popcount, 1/8 the memory traffic
+            neigh = (deg - 2 * loops).astype(np.int64)
+            cc = clustering_bitset(pack_bitset(A), neigh)
+        else:
+            cc = clustering_numba(A)
+    else:
+        #triangles per node are diag(A^3)/2, done as one BLAS matmul + einsum
+        A = matrix.astype(np.float32)
+        np.fill_diagonal(A, 0)
+        A2 = A @ A
+        tri = np.einsum('ij,ji->i', A2, A) / 2
+        neigh = A.sum(axis=1)
+        denom = neigh * (neigh - 1)
+        cc = np.divide(2 * tri, denom, out=np.zeros_like(tri), where=denom > 0)
+
+    return deg, cc
+
+
+def _process_subject(item)->tuple:
+    '''
+    Worker for the process pool: metrics for one named subject
+    :param item: (name, matrix) pair
+    :return: (name, degree array, clustering array)
+    '''
+    name, matrix = item
+    degree, clustering_coeff = calculate_metrics(matrix)
+    return name, degree, clustering_coeff
 
 
-def plot_network(matrix, matrix_name)->None:
+def calculate_metrics_batch(matrices, device='cpu')->tuple:
+    '''
+    Calculate degree and clustering coefficient for all subjects at once.
+    Subjects with the same node count are stacked into one (S, N, N) tensor
+    so each group is computed with a single batched matmul instead of a
+    per-matrix pass.
+    :param matrices: dictionary of adjacency matrices
+    :param device: 'cpu', or 'cuda' to run the batched matmul through cupy
+    :return: dictionaries of per-node degree and clustering arrays
+    '''
+    degree_all = {}
+    clustering_all = {}
+
+    if ENGINE == 'igraph' and IGRAPH_AVAILABLE:
+        #subjects are independent, so fan the per-matrix engine out across cores;
+        #workers only return data, all plotting stays in the main process
+        with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for name, degree, clustering_coeff in executor.map(_process_subject, matrices.items()):
+                degree_all[name] = degree
+                clustering_all[name] = clustering_coeff
+        return degree_all, clustering_all
+
+    if ENGINE == 'numba' and NUMBA_AVAILABLE:
+        #the numba kernels parallelize internally, so a plain loop is enough
+        for name, matrix in matrices.items():
+            degree_all[name], clustering_all[name] = calculate_metrics(matrix)
+        return degree_all, clustering_all
+
+    by_size = {}
+    for name, matrix in matrices.items():
+        by_size.setdefault(matrix.shape[0], []).append(name)
+
+    for n, names in by_size.items():
+        A = np.stack([matrices[name] for name in names]).astype(np.float32)
+        loops = np.diagonal(A, axis1=1, axis2=2) != 0
+        idx = np.arange(n)
+        A[:, idx, idx] = 0
+
+        #the diagonal is already zeroed, so a self-loop adds its full two here
+        deg = np.count_nonzero(A, axis=2) + 2 * loops
+        if device == 'cuda' and CUPY_AVAILABLE:
+            #one strided-batched gemm on the GPU, only the (S, N) result comes back
+            A_gpu = cp.asarray(A)
+            A2_gpu = cp.matmul(A_gpu, A_gpu)
+            tri = cp.einsum('sij,sji->si', A2_gpu, A_gpu).get() / 2
+        else:
+            A2 = np.matmul(A, A)  #batched sgemm across the subject axis
+            tri = np.einsum('sij,sji->si', A2, A) / 2
+        neigh = A.sum(axis=2)
+        denom = neigh * (neigh - 1)
+        cc = np.divide(2 * tri, denom, out=np.zeros_like(tri), where=denom > 0)
+
+        for s, name in enumerate(names):
+            degree_all[name] = deg[s]
+            clustering_all[name] = cc[s]
+
+    return degree_all, clustering_all
+
+
+def _source_hash(file_path)->str:
+    '''
+    md5 of the raw matrix file, used to key the metrics cache
+    :param file_path: path to the text file
+    :return: hex digest
+    '''
+    with open(file_path, 'rb') as file:
+        return hashlib.md5(file.read()).hexdigest()
+
+
+def load_metrics_cache(cache_path, source_hash)->tuple:
+    '''
+    Load cached per-subject metrics if they were computed from the
+    current source file
+    :param cache_path: path to the npz cache
+    :param source_hash: md5 of the current matrix file
+    :return: (degree_all, clustering_all) dictionaries, or None on a miss
+    '''
+    if not os.path.exists(cache_path):
+        return None
+
+    with np.load(cache_path) as cache:
+        if 'source_hash' not in cache.files or str(cache['source_hash']) != source_hash:
+            return None
+        degree_all = {}
+        clustering_all = {}
+        for key in cache.files:
+            if key.startswith('deg_'):
+                degree_all[key[4:]] = cache[key]
+            elif key.startswith('cc_'):
+                clustering_all[key[3:]] = cache[key]
+
+    return degree_all, clustering_all
+
+
+def save_metrics_cache(cache_path, source_hash, degree_all, clustering_all)->None:
+    '''
+    Persist per-subject metrics so unchanged inputs skip the compute pass
+    :param cache_path: path to the npz cache
+    :param source_hash: md5 of the matrix file the metrics came from
+    :param degree_all: dictionary of degree arrays
+    :param clustering_all: dictionary of clustering arrays
+    :return: None
+    '''
+    arrays = {'source_hash': np.array(source_hash)}
+    for name, deg in degree_all.items():
+        arrays['deg_' + name] = deg
+    for name, cc in clustering_all.items():
+        arrays['cc_' + name] = cc
+    np.savez(cache_path, **arrays)
+
+
+def plot_network(G, matrix_name, pos)->None:
     '''
     Plot the network graph
-    :param matrix: adjacency matrix
+    :param G: networkx graph of the subject
     :param matrix_name: name of the matrix
+    :param pos: precomputed node layout
     :return: None
     '''
-    G = nx.from_numpy_array(matrix)
-
-    plt.figure(figsize=(8, 6))
-    pos = nx.spring_layout(G)
+    fig = plt.figure(figsize=(8, 6))
 
     nx.draw_networkx_nodes(G, pos, node_color='darkred', node_size=500)
     nx.draw_networkx_edges(G, pos, width=1.0, alpha=0.5, edge_color='salmon')
@@ -62,7 +344,32 @@ def plot_network(matrix, matrix_name)->None:
     plt.title(f"Network Graph: {matrix_name}", fontsize=14, color='maroon')
     plt.axis('off')
     plt.tight_layout()
-    plt.show()
+    plt.savefig(f"net_{matrix_name}.png", dpi=90)
+    plt.close(fig)
+
+
+def _comparison_plot(fig, ax, group_names, nodes_all, metric_all, title, color, ylabel)->None:
+    '''
+    Render one healthy/sick comparison onto the shared axes and save it
+    :param fig: reusable figure
+    :param ax: axes belonging to fig, cleared before drawing
+    :param group_names: subject names in this group
+    :param nodes_all: node index array per subject
+    :param metric_all: metric array per subject
+    :param title: plot title, also the output file name
+    :param color: title color
+    :param ylabel: y axis label
+    :return: None
+    '''
+    ax.clear()
+    for name in group_names:
+        ax.plot(nodes_all[name], metric_all[name], marker='o', label=name)
+    ax.set_title(title, fontsize=14, color=color)
+    ax.set_xlabel('Node')
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(f'{title}.png', dpi=90)
 
 
 def main():
@@ -71,71 +378,61 @@ def main():
     show the network graph and plot the degree and clustering coefficient comparison.
     :return: None
     '''
+    parser = argparse.ArgumentParser(description='Degree and clustering comparison for brain adjacency matrices')
+    parser.add_argument('--plot-networks', action='store_true',
+                        help='also render one network graph image per subject')
+    parser.add_argument('--device', choices=['cpu', 'cuda'], default='cpu',
+                        help='where to run the batched matmul (cuda needs cupy)')
+    args = parser.parse_args()
+
     file_path = 'adj_matrices.txt'
-    matrices = read_matrices(file_path)
+    matrices, labels = read_matrices_binary(file_path)
 
-    degree_all = {}
-    clustering_coeff_all = {}
+    #reuse cached metrics when the input file has not changed
+    source_hash = _source_hash(file_path)
+    cached = load_metrics_cache('metrics_cache.npz', source_hash)
+    if cached is not None:
+        degree_all, clustering_coeff_all = cached
+    else:
+        #one batched pass over all subjects instead of a per-matrix loop
+        degree_all, clustering_coeff_all = calculate_metrics_batch(matrices, device=args.device)
+        save_metrics_cache('metrics_cache.npz', source_hash, degree_all, clustering_coeff_all)
 
-    for name, matrix in matrices.items():
-        degree, clustering_coeff = calculate_metrics(matrix)
-        degree_all[name] = degree
-        clustering_coeff_all[name] = clustering_coeff
-
-        plot_network(matrix, name)  #building the network graph
-
-
-    #separate healthy and sick cases
-    healthy_names = [name for name in degree_all.keys() if 'healthy' in name]
-    sick = [name for name in degree_all.keys() if 'healthy' not in name]
-
-    #healthy cases degree
-    plt.figure(figsize=(12, 6))
-    for name in healthy_names:
-        degree = degree_all[name]
-        plt.plot(list(degree.keys()), list(degree.values()), marker='o', label=name)
-    plt.title('Degree Comparison (Physiological)', fontsize=14, color='green')
-    plt.xlabel('Node')
-    plt.ylabel('Degree')
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
-
-    #sick cases degree
-    plt.figure(figsize=(12, 6))
-    for name in sick:
-        degree = degree_all[name]
-        plt.plot(list(degree.keys()), list(degree.values()), marker='o', label=name)
-    plt.title('Degree Comparison (Pathological)', fontsize=14, color='red')
-    plt.xlabel('Node')
-    plt.ylabel('Degree')
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
-
-    #healthy cases clustering
-    plt.figure(figsize=(12, 6))
-    for name in healthy_names:
-        clustering_coeff = clustering_coeff_all[name]
-        plt.plot(list(clustering_coeff.keys()), list(clustering_coeff.values()), marker='o', label=name)
-    plt.title('Clustering Coefficient Comparison (Physiological)', fontsize=14, color='green')
-    plt.xlabel('Node')
-    plt.ylabel('Clustering Coefficient')
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
-
-    #sick cases clustering
-    plt.figure(figsize=(12, 6))
-    for name in sick:
-        clustering_coeff = clustering_coeff_all[name]
-        plt.plot(list(clustering_coeff.keys()), list(clustering_coeff.values()), marker='o', label=name)
-    plt.title('Clustering Coefficient Comparison (Pathological)', fontsize=14, color='red')
-    plt.xlabel('Node')
-    plt.ylabel('Clustering Coefficient')
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
+    #node index arrays, built once and shared by every comparison plot
+    nodes_all = {name: np.arange(len(deg)) for name, deg in degree_all.items()}
+
+    if args.plot_networks:
+        layout_cache = {}
+
+        for name, matrix in matrices.items():
+            #build the graph once per matrix, for both layout and drawing
+            G = nx.from_numpy_array(matrix)
+
+            #spring layouts are expensive, so compute one reference layout
+            #per node count and reuse it for every subject of that size
+            n = matrix.shape[0]
+            if n not in layout_cache:
+                layout_cache[n] = nx.spring_layout(G, seed=42)
+
+            plot_network(G, name, layout_cache[n])  #building the network graph
+
+
+    #group healthy and sick cases using the labels assigned at ingest
+    groups = {'healthy': [], 'sick': []}
+    for name in matrices:
+        groups[labels[name]].append(name)
+
+    #one reusable canvas, one call per healthy/sick x degree/clustering combination
+    fig, ax = plt.subplots(figsize=(12, 6))
+    _comparison_plot(fig, ax, groups['healthy'], nodes_all, degree_all,
+                     'Degree Comparison (Physiological)', 'green', 'Degree')
+    _comparison_plot(fig, ax, groups['sick'], nodes_all, degree_all,
+                     'Degree Comparison (Pathological)', 'red', 'Degree')
+    _comparison_plot(fig, ax, groups['healthy'], nodes_all, clustering_coeff_all,
+                     'Clustering Coefficient Comparison (Physiological)', 'green', 'Clustering Coefficient')
+    _comparison_plot(fig, ax, groups['sick'], nodes_all, clustering_coeff_all,
+                     'Clustering Coefficient Comparison (Pathological)', 'red', 'Clustering Coefficient')
+    plt.close(fig)
 
 
 if __name__ == "__main__":